@@ -2,44 +2,17 @@ import streamlit as st
 import datetime
 import json
 
-# --- 1. SETUP & FUNCTIONS ---
+from residency_core import (
+    add_trip, calc_days, current_trips, empty_trips, iter_trips, serialize_trips, set_trips,
+    trip_deductions, trips_from_records, trips_key, window_start,
+)
+
+# --- 1. SETUP ---
 st.set_page_config(page_title="Ontario Residency Tracker", page_icon="🍁")
 
 # Initialize Session State to store trips while the app is open
-if 'trips' not in st.session_state:
-    st.session_state.trips = []
-
-def add_trip(start, end):
-    if start > end:
-        st.error("Error: Departure date cannot be after return date.")
-        return
-    st.session_state.trips.append({'start': start, 'end': end})
-    st.success(f"Added trip: {start} to {end}")
-
-def calculate_days(target_date):
-    # Logic: 2 Years back from target date
-    try:
-        start_window = target_date.replace(year=target_date.year - 2)
-    except ValueError:
-        start_window = target_date.replace(year=target_date.year - 2, day=28)
-
-    total_window_days = (target_date - start_window).days
-    days_absent = 0
-    
-    log_text = []
-
-    for trip in st.session_state.trips:
-        # Calculate Overlap
-        effective_start = max(trip['start'], start_window)
-        effective_end = min(trip['end'], target_date)
-
-        if effective_start < effective_end:
-            days_out = (effective_end - effective_start).days
-            days_absent += days_out
-            log_text.append(f"- Trip {trip['start']} to {trip['end']}: **{days_out} days** deducted.")
-    
-    days_present = total_window_days - days_absent
-    return days_present, days_absent, start_window, log_text
+if 'trip_starts' not in st.session_state:
+    set_trips(*empty_trips())
 
 # --- 2. APP LAYOUT ---
 st.title("🍁 Ontario Residency Calculator")
@@ -51,8 +24,8 @@ with st.sidebar:
     st.info("Web apps reset when closed. Save your data here!")
     
     # Download Button
-    if st.session_state.trips:
-        json_str = json.dumps([{'start': str(t['start']), 'end': str(t['end'])} for t in st.session_state.trips])
+    if st.session_state.trip_starts.size:
+        json_str = serialize_trips(trips_key(*current_trips()))
         st.download_button(
             label="Download My Trips (JSON)",
             data=json_str,
@@ -66,54 +39,59 @@ with st.sidebar:
         try:
             data = json.load(uploaded_file)
             # Convert strings back to dates
-            loaded_trips = []
-            for t in data:
-                loaded_trips.append({
-                    'start': datetime.datetime.strptime(t['start'], "%Y-%m-%d").date(),
-                    'end': datetime.datetime.strptime(t['end'], "%Y-%m-%d").date()
-                })
-            st.session_state.trips = loaded_trips
+            set_trips(*trips_from_records(data))
             st.success("Trips loaded successfully!")
         except:
             st.error("Error loading file.")
 
 # --- MAIN AREA: ADD TRIP ---
 st.subheader("1. Add Time Outside Ontario")
-col1, col2 = st.columns(2)
-with col1:
-    d_start = st.date_input("Departure Date", value=None)
-with col2:
-    d_end = st.date_input("Return Date", value=None)
-
-if st.button("Add Trip"):
+# Inputs only commit when the form is submitted, so picking dates doesn't rerun the app
+with st.form("add_trip_form"):
+    col1, col2 = st.columns(2)
+    with col1:
+        d_start = st.date_input("Departure Date", value=None)
+    with col2:
+        d_end = st.date_input("Return Date", value=None)
+    add_clicked = st.form_submit_button("Add Trip")
+
+if add_clicked:
     if d_start and d_end:
-        add_trip(d_start, d_end)
+        if d_start > d_end:
+            st.error("Error: Departure date cannot be after return date.")
+        else:
+            add_trip(d_start, d_end)
+            st.success(f"Added trip: {d_start} to {d_end}")
     else:
         st.warning("Please select both dates.")
 
 # Show current trips
-if st.session_state.trips:
+if st.session_state.trip_starts.size:
     st.write("### Your Trips:")
-    for i, trip in enumerate(st.session_state.trips):
+    for i, trip in enumerate(iter_trips(*current_trips())):
         st.text(f"{i+1}. OUT: {trip['start']} | IN: {trip['end']}")
     
     if st.button("Clear All Trips"):
-        st.session_state.trips = []
+        set_trips(*empty_trips())
         st.rerun()
 
 # --- CALCULATION SECTION ---
 st.divider()
 st.subheader("2. Check Status")
 
-target_date = st.date_input("Calculate status for date:", value=datetime.date.today())
+with st.form("check_status_form"):
+    target_date = st.date_input("Calculate status for date:", value=datetime.date.today())
+    calculate_clicked = st.form_submit_button("Calculate Now", type="primary")
 
-if st.button("Calculate Now", type="primary"):
-    present, absent, window_start, logs = calculate_days(target_date)
+if calculate_clicked:
+    present, absent, _ = calc_days(target_date, *current_trips())
+    logs = [f"- Trip {start} to {end}: **{days_out} days** deducted."
+            for start, end, days_out in trip_deductions(target_date, *current_trips())]
     
     st.metric(label="Days Physically Present", value=f"{present} Days")
     st.metric(label="Days Absent", value=f"{absent} Days")
     
-    st.write(f"**Checking Window:** {window_start} to {target_date}")
+    st.write(f"**Checking Window:** {window_start(target_date)} to {target_date}")
     
     if logs:
         with st.expander("See Calculation Details"):
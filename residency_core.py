@@ -0,0 +1,309 @@
+import streamlit as st
+import os
+import datetime
+import json
+import base64
+import calendar
+import zlib
+from bisect import bisect_right
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# Numba 内核默认关闭：冷启动 JIT 编译约 0.8 秒，而 ±120 天的图表数据用 NumPy 只需零点几毫秒。
+# 需要时设置环境变量 RESIDENCY_NUMBA=1 开启
+njit = None
+if os.environ.get("RESIDENCY_NUMBA") == "1":
+    try:
+        from numba import njit
+    except ImportError:
+        pass
+
+# 1.py / 2.py / new.py 共用的核心逻辑。
+# 各个页面只负责界面；缓存 (lru_cache / st.cache_data) 和可选的 Numba 编译都在这里，只做一次。
+
+# 常量定义
+THRESHOLD_DAYS = 365
+WINDOW_YEARS = 2
+UNIX_EPOCH_ORD = datetime.date(1970, 1, 1).toordinal()
+
+URL_EPOCH_ORD = datetime.date(2000, 1, 1).toordinal()  # URL 中的日期存为距此日期的 uint16 天数
+ZLIB_PREFIX = "~"  # 压缩过的 URL 数据以此开头 (不在 base64 字符表里)
+MAX_URL_TRIPS = 2000
+MAX_URL_BYTES = MAX_URL_TRIPS * 4  # 每个行程两个 2 字节的日期；限制解压后的大小
+
+# --- 行程存储 ---
+# 行程存为两个有序的 int64 序数数组 (SoA)：st.session_state.trip_starts / trip_ends
+
+def empty_trips():
+    return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+def current_trips():
+    return st.session_state.trip_starts, st.session_state.trip_ends
+
+def set_trips(trip_starts, trip_ends):
+    # 只在加载时排序一次，之后的添加都保持有序
+    order = np.argsort(trip_starts, kind='stable')
+    st.session_state.trip_starts = trip_starts[order]
+    st.session_state.trip_ends = trip_ends[order]
+
+def add_trip(start, end):
+    # 按出发日期插入到正确位置，保持有序
+    pos = np.searchsorted(st.session_state.trip_starts, start.toordinal(), side='right')
+    st.session_state.trip_starts = np.insert(st.session_state.trip_starts, pos, start.toordinal())
+    st.session_state.trip_ends = np.insert(st.session_state.trip_ends, pos, end.toordinal())
+
+def remove_trip(index):
+    st.session_state.trip_starts = np.delete(st.session_state.trip_starts, index)
+    st.session_state.trip_ends = np.delete(st.session_state.trip_ends, index)
+
+def iter_trips(trip_starts, trip_ends):
+    # 给界面用的 {'start', 'end'} 形式
+    for s, e in zip(trip_starts.tolist(), trip_ends.tolist()):
+        yield {'start': datetime.date.fromordinal(s), 'end': datetime.date.fromordinal(e)}
+
+def trips_key(trip_starts, trip_ends):
+    return tuple(zip(trip_starts.tolist(), trip_ends.tolist()))
+
+# --- 保存 / 加载 ---
+
+def trips_from_records(records, start='start', end='end'):
+    # [{'start': 'YYYY-MM-DD', 'end': ...}, ...] -> 两个序数数组
+    trip_starts = np.array([datetime.date.fromisoformat(t[start]).toordinal() for t in records], dtype=np.int64)
+    trip_ends = np.array([datetime.date.fromisoformat(t[end]).toordinal() for t in records], dtype=np.int64)
+    return trip_starts, trip_ends
+
+@st.cache_data(max_entries=256)
+def serialize_trips(key):
+    # 下载文件用的 JSON；key 是 (start, end) 序数元组，可以直接作为缓存键
+    return json.dumps([{'start': datetime.date.fromordinal(s).isoformat(),
+                        'end': datetime.date.fromordinal(e).isoformat()} for s, e in key])
+
+def _b64encode(payload):
+    return base64.urlsafe_b64encode(payload).rstrip(b"=").decode()
+
+def _b64decode(token):
+    return base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+
+def pack_trips(trip_starts, trip_ends):
+    # 每个日期 2 字节，base64 编码后放进 URL；返回值由 load_url 解析
+    offsets = np.empty(2 * trip_starts.size, dtype=np.int64)
+    offsets[0::2] = trip_starts
+    offsets[1::2] = trip_ends
+    days = offsets - URL_EPOCH_ORD
+    if days.size and (days.min() < 0 or days.max() > 0xFFFF) or trip_starts.size > MAX_URL_TRIPS:
+        # 超出 uint16 范围 (2000-01-01 之前或 2179 年之后) 或超过 unpack_trips 的上限：
+        # 退回 JSON 格式，保证原样还原
+        return json.dumps([{'s': trip['start'].isoformat(), 'e': trip['end'].isoformat()}
+                           for trip in iter_trips(trip_starts, trip_ends)], separators=(',', ':'))
+    token = _b64encode(days.astype('<u2').tobytes())
+
+    # 行程多时改存相邻日期的差值再 zlib 压缩，更短才用
+    deltas = np.diff(offsets, prepend=URL_EPOCH_ORD)
+    if deltas.size and deltas.min() >= -32768 and deltas.max() <= 32767:
+        compressed = ZLIB_PREFIX + _b64encode(zlib.compress(deltas.astype('<i2').tobytes(), 9))
+        if len(compressed) < len(token):
+            return compressed
+    return token
+
+def unpack_trips(token):
+    # URL 来自用户，解码后必须校验；出错时抛 ValueError，由 load_url 兜底
+    if token.startswith(ZLIB_PREFIX):
+        inflater = zlib.decompressobj()
+        payload = inflater.decompress(_b64decode(token[len(ZLIB_PREFIX):]), MAX_URL_BYTES)
+        if inflater.unconsumed_tail or not inflater.eof:
+            raise ValueError("compressed trip data too large or truncated")
+        deltas = np.frombuffer(payload, dtype='<i2')
+        offsets = np.cumsum(deltas.astype(np.int64)) + URL_EPOCH_ORD
+    else:
+        payload = _b64decode(token)
+        if len(payload) > MAX_URL_BYTES:
+            raise ValueError("too many trips")
+        offsets = np.frombuffer(payload, dtype='<u2').astype(np.int64) + URL_EPOCH_ORD
+    if offsets.size % 2:
+        raise ValueError("odd number of dates")
+    if offsets.size and (offsets.min() < URL_EPOCH_ORD or offsets.max() > URL_EPOCH_ORD + 0xFFFF):
+        raise ValueError("date out of range")
+    trip_starts, trip_ends = offsets[0::2].copy(), offsets[1::2].copy()
+    if (trip_ends < trip_starts).any():
+        raise ValueError("trip ends before it starts")
+    return trip_starts, trip_ends
+
+def load_url():
+    # 只读取一次 query_params
+    raw = st.query_params.get("data")
+    if raw:
+        try:
+            if not raw.startswith("["):
+                return unpack_trips(raw)
+            # 兼容旧链接中的 JSON 格式
+            return trips_from_records(json_loads(raw), start='s', end='e')
+        except Exception:
+            return empty_trips()
+    return empty_trips()
+
+def save_url(trip_starts, trip_ends):
+    if trip_starts.size:
+        st.query_params["data"] = pack_trips(trip_starts, trip_ends)
+    else:
+        st.query_params.pop("data", None)
+
+# --- 计算 ---
+
+@lru_cache(maxsize=256)
+def absence_index(key):
+    # 合并重叠行程，避免重复扣除天数；cum[i] = 第 i 段之前的累计离境天数
+    merged = []
+    for s, e in sorted(key):
+        if e <= s:
+            # 结束不晚于出发的行程 (上传文件或旧链接里可能出现) 不扣天数，与原逻辑一致
+            continue
+        if merged and s <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+
+    starts = tuple(s for s, _ in merged)
+    ends = tuple(e for _, e in merged)
+    cum = [0]
+    for s, e in merged:
+        cum.append(cum[-1] + e - s)
+    return starts, ends, tuple(cum)
+
+def absent_before(index, x):
+    # 截至序数 x 的累计离境天数 (二分查找)
+    starts, ends, cum = index
+    k = bisect_right(starts, x) - 1
+    if k < 0:
+        return 0
+    return cum[k] + min(x, ends[k]) - starts[k]
+
+@lru_cache(maxsize=1024)
+def window_start_ord(target_ord):
+    # 窗口起点 = 同月同日往前 WINDOW_YEARS 年；2月29日在平年退回到2月28日
+    d = datetime.date.fromordinal(target_ord)
+    year = d.year - WINDOW_YEARS
+    day = 28 if (d.month, d.day) == (2, 29) and not calendar.isleap(year) else d.day
+    return datetime.date(year, d.month, day).toordinal()
+
+def window_start(target_date):
+    return datetime.date.fromordinal(window_start_ord(target_date.toordinal()))
+
+@lru_cache(maxsize=4096)
+def _calc_days_cached(target_ord, key, today_ord):
+    # 纯函数版本：参数全部是序数 (ordinal)，可以直接作为缓存键
+    window_ord = window_start_ord(target_ord)
+    total_window_days = target_ord - window_ord
+    if not key:
+        return total_window_days, 0, 0
+
+    index = absence_index(key)
+    days_absent = absent_before(index, target_ord) - absent_before(index, window_ord)
+    # 今天之后 (窗口内) 的离境天数
+    future_start = min(target_ord, max(window_ord, today_ord))
+    future_conflict_days = absent_before(index, target_ord) - absent_before(index, future_start)
+
+    days_present = total_window_days - days_absent
+    return days_present, days_absent, future_conflict_days
+
+def calc_days(target_date, trip_starts, trip_ends, today=None):
+    # 返回 (居住天数, 离境天数, 今天之后的离境天数)
+    today = today or datetime.date.today()
+    return _calc_days_cached(target_date.toordinal(), trips_key(trip_starts, trip_ends),
+                             today.toordinal())
+
+def trip_deductions(target_date, trip_starts, trip_ends):
+    # 计算明细：按合并后的离境区间列出窗口内扣除的天数，合计与 calc_days 的离境天数一致
+    target_ord = target_date.toordinal()
+    window_ord = window_start_ord(target_ord)
+    starts, ends, _ = absence_index(trips_key(trip_starts, trip_ends))
+    deductions = []
+    for s, e in zip(starts, ends):
+        days_out = min(e, target_ord) - max(s, window_ord)
+        if days_out > 0:
+            deductions.append((datetime.date.fromordinal(s), datetime.date.fromordinal(e), days_out))
+    return deductions
+
+def window_starts(dates):
+    # 向量化的 date.replace(year=year - WINDOW_YEARS)，2月29日退回到2月28日
+    days = (dates - UNIX_EPOCH_ORD).astype('datetime64[D]')
+    years = days.astype('datetime64[Y]')
+    months = days.astype('datetime64[M]')
+    month_of_year = months - years.astype('datetime64[M]')
+    day_of_month = days - months.astype('datetime64[D]')
+
+    window_month = (years - WINDOW_YEARS).astype('datetime64[M]') + month_of_year
+    month_len = (window_month + 1).astype('datetime64[D]') - window_month.astype('datetime64[D]')
+    window_day = np.minimum(day_of_month, month_len - 1)
+    return (window_month.astype('datetime64[D]') + window_day).astype(np.int64) + UNIX_EPOCH_ORD
+
+def absent_before_array(index, x):
+    # absent_before 的向量化版本
+    starts, ends, cum = (np.asarray(a, dtype=np.int64) for a in index)
+    if starts.size == 0:
+        return np.zeros_like(x)
+    k = np.searchsorted(starts, x, side='right') - 1
+    kk = np.maximum(k, 0)
+    part = cum[kk] + np.minimum(x, ends[kk]) - starts[kk]
+    return np.where(k >= 0, part, 0)
+
+if njit is not None:
+    @njit(cache=True)
+    def _sweep_absent(dates, windows, starts, ends, cum):
+        # 每个日期两次二分查找，无 (D, T) 临时数组。
+        # 不用 parallel=True：Streamlit 在多个线程里同时跑脚本，Numba 的线程层不支持并发调用
+        out = np.zeros(dates.size, np.int64)
+        if starts.size == 0:
+            return out
+        for i in range(dates.size):
+            a = 0
+            k = np.searchsorted(starts, dates[i], side='right') - 1
+            if k >= 0:
+                a += cum[k] + min(dates[i], ends[k]) - starts[k]
+            k = np.searchsorted(starts, windows[i], side='right') - 1
+            if k >= 0:
+                a -= cum[k] + min(windows[i], ends[k]) - starts[k]
+            out[i] = a
+        return out
+
+def presence_sweep(dates, index):
+    # 一次性计算每个日期 (序数数组) 的居住天数
+    windows = window_starts(dates)
+    if not index[0]:
+        # 没有行程：窗口内每天都算居住
+        return dates - windows
+    if njit is not None:
+        starts, ends, cum = (np.asarray(a, dtype=np.int64) for a in index)
+        absent = _sweep_absent(dates, windows, starts, ends, cum)
+    else:
+        absent = absent_before_array(index, dates) - absent_before_array(index, windows)
+    return (dates - windows) - absent
+
+@st.cache_data(max_entries=256)
+def build_chart_data(target_ord, key):
+    # 只缓存 DataFrame；输入不变时跳过整个计算
+    # 为了看清交叉点，我们将范围设为前后 120 天
+    days_range = 120
+    dates = np.arange(target_ord - days_range, target_ord + days_range + 1, dtype=np.int64)
+
+    index = absence_index(key)
+    presence = presence_sweep(dates, index)
+
+    # --- 核心逻辑：检测交叉点 ---
+    # 如果昨天及格，今天不及格 (跌破) OR 昨天不及格，今天及格 (回升)
+    passing = presence >= THRESHOLD_DAYS
+    cross_idx = np.flatnonzero(passing[1:] != passing[:-1]) + 1
+
+    # 按列直接构造 DataFrame；交叉点只是同一行上的一个布尔标记，
+    # 图表各层共用这一份数据，标签在前端由日期生成
+    return pd.DataFrame({
+        "Date": (dates - UNIX_EPOCH_ORD).astype('datetime64[D]'),
+        "Days Present": presence,
+        "Cross": np.isin(np.arange(dates.size), cross_idx)
+    })